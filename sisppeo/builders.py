@@ -222,6 +222,22 @@ class ProductBuilder:
         reader.create_ds()
         self._extracted_ds = reader.dataset
 
+    @staticmethod
+    def _shared_band(band: xr.DataArray) -> xr.DataArray:
+        """Returns a read-only view of a band shared between algorithms.
+
+        Algorithms (including user-registered ones) must not modify their
+        input arrays in place: since the underlying data is shared, such an
+        in-place write raises an error instead of silently corrupting the
+        extracted data used by the next algorithms and masks.
+        """
+        band = band.copy(deep=False)
+        if isinstance(band.data, np.ndarray):
+            view = band.data.view()
+            view.flags.writeable = False
+            band.data = view
+        return band
+
     @staticmethod
     def _compute_algo(algo,
                       input_dataarrays: List[xr.DataArray],
@@ -235,6 +251,15 @@ class ProductBuilder:
         out_dataarrays = {}
         for out_dataarray, variable, long_name in zip(output, variables,
                                                       long_names):
+            # An algorithm may return (a view of) one of its inputs, which
+            # are shared with other algorithms: such an output is copied
+            # before being modified in place.
+            out_data = out_dataarray.data
+            if isinstance(out_data, np.ndarray) and any(
+                    isinstance(arr.data, np.ndarray)
+                    and np.may_share_memory(out_data, arr.data)
+                    for arr in input_dataarrays):
+                out_dataarray = out_dataarray.copy()
             np.nan_to_num(out_dataarray, False, np.nan, np.nan, np.nan)
             out_dataarray.attrs.update({
                 'grid_mapping': 'crs',
@@ -251,7 +276,9 @@ class ProductBuilder:
         data_type = self._extracted_ds.attrs['data_type']
         epsg_code = CRS.from_cf(self._extracted_ds.crs.attrs).to_epsg()
         for algo in self._algos:
-            input_dataarrays = [self._extracted_ds[band].copy()
+            # Algorithms never modify their inputs: the underlying data can
+            # be shared between them (as read-only views).
+            input_dataarrays = [self._shared_band(self._extracted_ds[band])
                                 for band in algo.requested_bands]
             out_algos[algo.name] = self._compute_algo(algo, input_dataarrays,
                                                       data_type, epsg_code)
@@ -14,9 +14,13 @@
 
 """Contains various useful functions used by algorithms."""
 
+import copy
+from functools import lru_cache
 from pathlib import Path
-from typing import Tuple, Union
+from typing import Callable, Tuple, Union
 
+import numpy as np
+import xarray as xr
 import yaml
 
 from sisppeo.utils.exceptions import InputError
@@ -26,6 +30,23 @@ from sisppeo.utils.exceptions import InputError
 P = Union[str, Path]
 
 
+# Parsed calibration files: path -> (modification time, content).
+_calib_files = {}
+
+
+def _read_calib_file(path: Path) -> dict:
+    """Returns the content of a calibration file (parsed again if edited)."""
+    path = path.resolve()
+    mtime_ns = path.stat().st_mtime_ns
+    cached = _calib_files.get(path)
+    if cached is None or cached[0] != mtime_ns:
+        with open(path, 'r') as f:
+            cached = (mtime_ns, yaml.full_load(f))
+        # Replaces the stale version of the file (if any).
+        _calib_files[path] = cached
+    return cached[1]
+
+
 def load_calib(calibration: P,
                default_calibration_file: Path,
                default_calibration_name: str) -> Tuple[dict, str]:
@@ -47,24 +68,28 @@ def load_calib(calibration: P,
     Returns:
         A dict of parameters (model coefficients) and the name of
         the chosen calibration.
+
+    Note:
+        Calibration files are parsed once and then kept in memory (until
+        they are modified); the returned dict is a copy, so it can be safely
+        modified by the caller.
     """
     if calibration is None:
-        with open(default_calibration_file, 'r') as f:
-            params = yaml.full_load(f)[default_calibration_name]
+        params = _read_calib_file(
+            default_calibration_file)[default_calibration_name]
         name = default_calibration_name
     elif isinstance(calibration, str):
-        with open(default_calibration_file, 'r') as f:
-            params = yaml.full_load(f)[calibration]
+        params = _read_calib_file(default_calibration_file)[calibration]
         name = calibration
     elif isinstance(calibration, Path):
-        with open(calibration, 'r') as f:
-            params = yaml.full_load(f)
+        params = _read_calib_file(calibration)
         name = 'custom'
     else:
         raise InputError(f'Invalid calibration: {calibration}')
-    return params, name
+    return copy.deepcopy(params), name
 
 
+@lru_cache(maxsize=None)
 def producttype_to_sat(product_type: str) -> str:
     """Returns the satellite for the given product_type.
 
@@ -76,3 +101,47 @@ def producttype_to_sat(product_type: str) -> str:
         The name of the satellite that matches the input product_type.
     """
     return product_type.split('_')[0]
+
+
+def apply_kernel(kernel: Callable,
+                 *arrays: xr.DataArray,
+                 **params) -> xr.DataArray:
+    """Runs an element-wise kernel on one or several arrays.
+
+    The kernel works on raw arrays (not on DataArrays), so the output
+    DataArray is only built once. If input arrays are backed by dask, the
+    kernel is lazily applied chunk by chunk (and thus in parallel).
+    Input arrays are given to the kernel in single precision (which is
+    plenty for reflectances and halves memory traffic compared to float64).
+    Floating point errors (e.g. divisions by zero) are silenced while the
+    kernel runs: invalid pixels simply end up as NaN (or inf).
+
+    Args:
+        kernel: An element-wise function taking one raw array per input
+            DataArray (and keyword parameters) and returning an array of
+            the same shape. Input arrays are broadcast against each other
+            (and 0-d ones promoted to 1-d) before being given to the
+            kernel, so they all have the shape of the output.
+        *arrays: The input arrays.
+        **params: Scalar parameters (e.g. model coefficients) forwarded to
+            the kernel.
+
+    Returns:
+        The output array of the kernel.
+    """
+    def _kernel(*raw_arrays, **kwargs):
+        shape = np.broadcast_shapes(*(np.shape(arr) for arr in raw_arrays))
+        # Kernels reuse the buffer of their first operation for the next
+        # (in-place) ones, so all inputs must have the output shape.
+        # Operations on 0-d arrays return scalars, which kernels could not
+        # modify in place: such inputs are promoted to 1-d arrays.
+        raw_arrays = np.broadcast_arrays(
+            *(np.atleast_1d(arr).astype(np.float32, copy=False)
+              for arr in raw_arrays)
+        )
+        with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+            out = kernel(*raw_arrays, **kwargs)
+        return out.reshape(shape) if not shape else out
+
+    return xr.apply_ufunc(_kernel, *arrays, kwargs=params,
+                          dask='parallelized', output_dtypes=[np.float32])
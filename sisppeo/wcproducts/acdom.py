@@ -34,7 +34,7 @@ from typing import Optional, Union
 import numpy as np
 import xarray as xr
 
-from sisppeo.utils.algos import load_calib, producttype_to_sat
+from sisppeo.utils.algos import apply_kernel, load_calib, producttype_to_sat
 from sisppeo.utils.config import wc_algo_config as algo_config, wc_calib
 from sisppeo.utils.exceptions import InputError
 
@@ -44,6 +44,19 @@ P = Union[str, Path]
 N = Union[int, float]
 
 
+def _acdom_brezonik(shortwl, longwl, a1, a2, valid_limit):
+    # exp(a1 + a2 * ln(shortwl / longwl)), computed in a single buffer.
+    # The band ratio is the same for rho and Rrs: no conversion is needed.
+    acdom = np.divide(shortwl, longwl)
+    np.log(acdom, out=acdom)
+    acdom *= a2
+    acdom += a1
+    np.exp(acdom, out=acdom)
+    # Invalid pixels are all masked at once, on the output.
+    acdom[(shortwl < 0) | (acdom < 0) | (acdom > valid_limit)] = np.nan
+    return acdom
+
+
 class ACDOMBrezonik:
     """CDOM absorption (in m-1) at 440 nm from Brezonik et al., 2015.
 
@@ -77,9 +90,9 @@ class ACDOMBrezonik:
                 algorithm (default=_default_calibration_name).
             **_ignored: Unused kwargs sent to trash.
         """
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from invalid_product
@@ -90,7 +103,7 @@ class ACDOMBrezonik:
         )
         self._valid_limit = calibration_dict['validity_limit']
         try:
-            params = calibration_dict[producttype_to_sat(product_type)]
+            params = calibration_dict[sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with this calibration'
             raise InputError(msg) from invalid_product
@@ -117,16 +130,9 @@ class ACDOMBrezonik:
             An array (dimension 1 * N * M) of acdom(440) (in m-1).
         """
 
-        if data_type == 'rho':
-            ref_shortwl = ref_shortwl / np.pi
-            ref_longwl = ref_longwl / np.pi
-
-        np.warnings.filterwarnings('ignore')
-        ref_shortwl = ref_shortwl.where(ref_shortwl >= 0)
-        ref_longwl = ref_longwl.where(ref_shortwl >= 0)
-
         # pylint: disable=no-member
         # Loaded in __init__ whit "__dict__.update".
-        acdom = np.exp(self.a1 + self.a2 * np.log(ref_shortwl / ref_longwl))
-        acdom = acdom.where((acdom >= 0) & (acdom <= self._valid_limit))
+        acdom = apply_kernel(_acdom_brezonik, ref_shortwl, ref_longwl,
+                             a1=self.a1, a2=self.a2,
+                             valid_limit=self._valid_limit)
         return acdom
@@ -29,15 +29,21 @@ Example:
 
     algo2 = CHLAGittelson('L8_GRS', '3_bands', 'Gitelson_2008')
     out_array2 = algo2(red_array, rededge_array, nir_array, 'rrs')
+
+Algorithms are computed pixel by pixel, so input arrays can also be stacks
+of several dates (T * N * M). If they are backed by dask (e.g.
+"ds.chunk({'time': 1, 'y': 2048, 'x': 2048})"), the output is lazy and each
+chunk is processed independently (and in parallel) once computed.
 """
 
+import logging
 from pathlib import Path
 from typing import Optional, Union
 
 import numpy as np
 import xarray as xr
 
-from sisppeo.utils.algos import load_calib, producttype_to_sat
+from sisppeo.utils.algos import apply_kernel, load_calib, producttype_to_sat
 from sisppeo.utils.config import wc_algo_config as algo_config, wc_calib
 from sisppeo.utils.exceptions import InputError
 
@@ -46,6 +52,114 @@ from sisppeo.utils.exceptions import InputError
 P = Union[str, Path]
 N = Union[int, float]
 
+logger = logging.getLogger(__name__)
+
+
+# Kernels below work on raw arrays and reuse their own buffers (through
+# "out=" and in-place operators) so that each formula only allocates one or
+# two full-size arrays. Pixels with a negative reflectance (in any of the
+# input bands) are masked once, on the output, rather than on each band;
+# out-of-range values (i.e. negative or above "valid_limit") are masked in
+# the same pass.
+def _gons(red, rededge, nir, a, aw665, aw705, aphy_star, p, bb_offset,
+          valid_limit):
+    # bb783 = a * nir / (bb_offset - 0.6 * nir), where "bb_offset" is 0.082
+    # for Rrs and 0.082 * pi for rho (so that nir is never divided by pi).
+    bb783 = np.multiply(nir, -0.6)
+    bb783 += bb_offset
+    np.divide(nir, bb783, out=bb783)
+    bb783 *= a
+    chla = np.add(bb783, aw705)
+    chla *= rededge
+    chla /= red
+    chla -= aw665
+    np.power(bb783, p, out=bb783)
+    chla -= bb783
+    chla /= aphy_star
+    chla[(red < 0) | (rededge < 0) | (nir < 0)
+         | (chla < 0) | (chla > valid_limit)] = np.nan
+    return chla
+
+
+def _gitelson_3bands(red, rededge, nir, a, b, valid_limit):
+    # 1 / red - 1 / rededge == (rededge - red) / (red * rededge)
+    chla = np.subtract(rededge, red)
+    buf = np.multiply(red, rededge)
+    chla /= buf
+    chla *= nir
+    chla *= b
+    chla += a
+    chla[(red < 0) | (rededge < 0) | (nir < 0)
+         | (chla < 0) | (chla > valid_limit)] = np.nan
+    return chla
+
+
+def _gitelson_2bands(red, nir, a, b, valid_limit):
+    chla = np.divide(nir, red)
+    chla *= b
+    chla += a
+    chla[(red < 0) | (nir < 0) | (chla < 0) | (chla > valid_limit)] = np.nan
+    return chla
+
+
+def _gurlin(red, rededge, a, b, c, valid_limit):
+    ratio = np.divide(rededge, red)
+    # Horner scheme: (a * ratio + b) * ratio + c
+    chla = np.multiply(ratio, a)
+    chla += b
+    chla *= ratio
+    chla += c
+    chla[(red < 0) | (rededge < 0)
+         | (chla < 0) | (chla > valid_limit)] = np.nan
+    return chla
+
+
+def _oc3(violet, blue, green, a0, a1, a2, a3, a4, valid_limit):
+    # log10(max(Rrs_B1, Rrs_B2) / Rrs_B3)
+    max_ratio = np.maximum(violet, blue)
+    max_ratio /= green
+    np.log10(max_ratio, out=max_ratio)
+    return _oc(max_ratio, a0, a1, a2, a3, a4, valid_limit)
+
+
+def _oc2(blue, green, a0, a1, a2, a3, a4, valid_limit):
+    # log10(Rrs_B2 / Rrs_B3)
+    ratio = np.divide(blue, green)
+    np.log10(ratio, out=ratio)
+    return _oc(ratio, a0, a1, a2, a3, a4, valid_limit)
+
+
+def _oc(max_ratio, a0, a1, a2, a3, a4, valid_limit):
+    # Horner scheme: (((a4 * x + a3) * x + a2) * x + a1) * x + a0
+    chla = np.multiply(max_ratio, a4)
+    for coef in (a3, a2, a1):
+        chla += coef
+        chla *= max_ratio
+    chla += a0
+    # 10 ** chla, using the (faster) exponential ufunc
+    chla *= np.log(10)
+    np.exp(chla, out=chla)
+    # An exponential is never negative: only the upper bound is checked.
+    chla[chla > valid_limit] = np.nan
+    return chla
+
+
+def _lins(red, rededge, p, q, valid_limit):
+    chla = np.divide(rededge, red)
+    chla *= p
+    chla += q
+    chla[(red < 0) | (rededge < 0)
+         | (chla < 0) | (chla > valid_limit)] = np.nan
+    return chla
+
+
+def _ndci(red, nir):
+    ndci = np.subtract(nir, red)
+    buf = np.add(nir, red)
+    ndci /= buf
+    ndci[(red < 0) | (nir < 0)] = np.nan
+    return ndci
+
 
 class CHLAGons:
     """Chlorophyll-a concentration (in mg/m3) from 3 red bands after Gons et al., 1999, 2002, 2004
@@ -79,9 +193,9 @@ class CHLAGons:
                 the algorithm (default=_default_calibration_name).
             **_ignored: Unused kwargs sent to trash.
         """
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from invalid_product
@@ -92,7 +206,7 @@ class CHLAGons:
         )
         self._valid_limit = calibration_dict['validity_limit']
         try:
-            params = calibration_dict[producttype_to_sat(product_type)]
+            params = calibration_dict[sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with this calibration'
             raise InputError(msg) from invalid_product
@@ -121,24 +235,16 @@ class CHLAGons:
             An array (dimension 1 * N * M) of chl-a (in mg/m3).
         """
 
-        if data_type == 'rho':
-            ref_red = ref_red / np.pi
-            ref_rededge = ref_rededge / np.pi
-            ref_nir = ref_nir / np.pi
-
-        np.warnings.filterwarnings('ignore')
-        ref_red = ref_red.where(ref_red >= 0)
-        ref_rededge = ref_rededge.where(ref_red >= 0)
-        ref_nir = ref_red.where(ref_nir >= 0)
+        # The rededge/red ratio doesn't depend on data_type: only bb783 does,
+        # and it is handled by the kernel through "bb_offset".
+        bb_offset = 0.082 * np.pi if data_type == 'rho' else 0.082
 
-        bb783 = ref_nir.where(ref_nir >= 0).copy()
         # pylint: disable=no-member
         # Loaded in __init__ whit "__dict__.update".
-        bb783 = (self.a * bb783) / (0.082 - 0.6 * bb783)
-        aphy = ref_rededge / ref_red * (self.aw705 + bb783) - self.aw665 \
-            - np.power(bb783, self.p)
-        chla = aphy / self.aphy_star
-        chla = chla.where((chla >= 0) & (chla <= self._valid_limit))
+        chla = apply_kernel(_gons, ref_red, ref_rededge, ref_nir,
+                            a=self.a, aw665=self.aw665, aw705=self.aw705,
+                            aphy_star=self.aphy_star, p=self.p,
+                            bb_offset=bb_offset, valid_limit=self._valid_limit)
         return chla
 
 
@@ -177,9 +283,13 @@ class CHLAGitelson:
             **_ignored: Unused kwargs sent to trash.
         """
         self._design = design
+        if design == '3_bands':
+            self._compute = self._compute_3bands
+        else:
+            self._compute = self._compute_2bands
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from invalid_product
@@ -190,7 +300,7 @@ class CHLAGitelson:
         )
         self._valid_limit = calibration_dict['validity_limit']
         try:
-            params = calibration_dict[producttype_to_sat(product_type)]
+            params = calibration_dict[sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with this calibration'
             raise InputError(msg) from invalid_product
@@ -199,6 +309,8 @@ class CHLAGitelson:
                      'design': design,
                      'validity_limit': self._valid_limit,
                      **params}
+        logger.debug('%s: %s design selected (validity limit: %s)',
+                     self.name, design, self._valid_limit)
 
     def __call__(self,
                  ref_red: xr.DataArray,
@@ -220,29 +332,23 @@ class CHLAGitelson:
             An array (dimension 1 * N * M) of chl-a (in mg/m3).
         """
 
-        if data_type == 'rho':
-            ref_red = ref_red / np.pi
-            ref_rededge = ref_rededge / np.pi
-            ref_nir = ref_nir / np.pi
-
-        np.warnings.filterwarnings('ignore')
-        ref_red = ref_red.where(ref_red >= 0)
-        ref_rededge = ref_rededge.where(ref_red >= 0)
-        ref_nir = ref_red.where(ref_nir >= 0)
-        print(self._design, self._valid_limit)
-        if self._design == '3_bands':
-            print('3 bands selected')
-            # pylint: disable=no-member
-            # Loaded in __init__ whit "__dict__.update".
-            chla = self.a_3bands + self.b_3bands \
-                * (1 / ref_red - 1 / ref_rededge) * ref_nir
-        else:
-            print('2 bands selected')
-            # pylint: disable=no-member
-            # Loaded in __init__ whit "__dict__.update".
-            chla = self.a_2bands + self.b_2bands * (1 / ref_red) * ref_nir
-        chla = chla.where((chla >= 0) & (chla <= self._valid_limit))
-        return chla
+        # Both designs only rely on band ratios: there is no need to convert
+        # rho into Rrs.
+        return self._compute(ref_red, ref_rededge, ref_nir)
+
+    def _compute_3bands(self, ref_red, ref_rededge, ref_nir):
+        # pylint: disable=no-member
+        # Loaded in __init__ whit "__dict__.update".
+        return apply_kernel(_gitelson_3bands, ref_red, ref_rededge, ref_nir,
+                            a=self.a_3bands, b=self.b_3bands,
+                            valid_limit=self._valid_limit)
+
+    def _compute_2bands(self, ref_red, _, ref_nir):
+        # pylint: disable=no-member
+        # Loaded in __init__ whit "__dict__.update".
+        return apply_kernel(_gitelson_2bands, ref_red, ref_nir,
+                            a=self.a_2bands, b=self.b_2bands,
+                            valid_limit=self._valid_limit)
 
 
 class CHLAGurlin:
@@ -277,9 +383,9 @@ class CHLAGurlin:
                 algorithm (default=_default_calibration_name).
             **_ignored: Unused kwargs sent to trash.
         """
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from invalid_product
@@ -290,7 +396,7 @@ class CHLAGurlin:
         )
         self._valid_limit = calibration_dict['validity_limit']
         try:
-            params = calibration_dict[producttype_to_sat(product_type)]
+            params = calibration_dict[sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with this calibration'
             raise InputError(msg) from invalid_product
@@ -316,14 +422,11 @@ class CHLAGurlin:
         Returns:
             An array (dimension 1 * N * M) of chl-a (in mg/m3).
         """
-        np.warnings.filterwarnings('ignore')
-        ref_red = ref_red.where(ref_red >= 0)
-        ref_rededge = ref_rededge.where(ref_red >= 0)
         # pylint: disable=no-member
         # Loaded in __init__ whit "__dict__.update".
-        chla = self.a * pow(ref_rededge / ref_red, 2) + self.b \
-            * (ref_rededge / ref_red) + self.c
-        chla = chla.where((chla >= 0) & (chla <= self._valid_limit))
+        chla = apply_kernel(_gurlin, ref_red, ref_rededge,
+                            a=self.a, b=self.b, c=self.c,
+                            valid_limit=self._valid_limit)
         return chla
 
 
@@ -361,9 +464,9 @@ class CHLAOC:
                 algorithm (default=_default_calibration_name).
             **_ignored: Unused kwargs sent to trash.
         """
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from invalid_product
@@ -375,7 +478,7 @@ class CHLAOC:
         self._valid_limit = calibration_dict['validity_limit']
         self._version = calibration_name
         try:
-            params = calibration_dict[producttype_to_sat(product_type)]
+            params = calibration_dict[sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with this calibration'
             raise InputError(msg) from invalid_product
@@ -383,6 +486,7 @@ class CHLAOC:
         self.meta = {'calibration': self._version,
                      'validity_limit': self._valid_limit,
                      **params}
+        logger.debug('%s: %s is used', self.name, self._version)
 
     def __call__(self,
                  ref_violet: xr.DataArray,
@@ -404,27 +508,17 @@ class CHLAOC:
             An array (dimension 1 * N * M) of chl-a (in mg/m3).
         """
 
-        np.warnings.filterwarnings('ignore')
-        if data_type == 'rho':
-            ref_violet = ref_violet / np.pi
-            ref_blue = ref_blue / np.pi
-            ref_green = ref_green / np.pi
-
-        if self._version == 'OC3':
-            print(f'{self._version} is used')
-            max_ratio = np.log10(np.maximum(ref_violet.values, ref_blue.values)
-                               / ref_green)
-            # np.log(max(Rrs_B1, Rrs_B2) / Rrs_B3))
-        else:   # self._version == 'OC2'
-            print(f'{self._version} is used')
-            max_ratio = np.log10(ref_blue.values / ref_green)
+        # Band ratios are the same for rho and Rrs: there is no need to convert
+        # rho into Rrs.
         # pylint: disable=no-member
         # Loaded in __init__ whit "__dict__.update".
-        chla = np.power(10, self.a0 + self.a1 * max_ratio + self.a2
-                        * np.power(max_ratio, 2) + self.a3
-                        * np.power(max_ratio, 3) + self.a4
-                        * np.power(max_ratio, 4))
-        chla = chla.where((chla >= 0) & (chla <= self._valid_limit))
+        coefs = {'a0': self.a0, 'a1': self.a1, 'a2': self.a2, 'a3': self.a3,
+                 'a4': self.a4, 'valid_limit': self._valid_limit}
+        if self._version == 'OC3':
+            chla = apply_kernel(_oc3, ref_violet, ref_blue, ref_green,
+                                **coefs)
+        else:   # self._version == 'OC2'
+            chla = apply_kernel(_oc2, ref_blue, ref_green, **coefs)
         return chla
 
 
@@ -460,9 +554,9 @@ class CHLALins:
                 algorithm (default=_default_calibration_name).
             **_ignored: Unused kwargs sent to trash.
         """
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from invalid_product
@@ -473,7 +567,7 @@ class CHLALins:
         )
         self._valid_limit = calibration_dict['validity_limit']
         try:
-            params = calibration_dict[producttype_to_sat(product_type)]
+            params = calibration_dict[sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with this calibration'
             raise InputError(msg) from invalid_product
@@ -499,13 +593,10 @@ class CHLALins:
         Returns:
             An array (dimension 1 * N * M) of chl-a (in mg/m3).
         """
-        np.warnings.filterwarnings('ignore')
-        ref_red = ref_red.where(ref_red >= 0)
-        ref_rededge = ref_rededge.where(ref_red >= 0)
         # pylint: disable=no-member
         # Loaded in __init__ whit "__dict__.update".
-        chla = self.p * (ref_rededge / ref_red) + self.q
-        chla = chla.where((chla >= 0) & (chla <= self._valid_limit))
+        chla = apply_kernel(_lins, ref_red, ref_rededge, p=self.p, q=self.q,
+                            valid_limit=self._valid_limit)
         return chla
 
 
@@ -532,9 +623,9 @@ class NDCI:
               S2_ESA_L2A or L8_USGS_L1GT)
             **_ignored: Unused kwargs send to trash.
         """
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as unvalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from unvalid_product
@@ -556,8 +647,4 @@ class NDCI:
         Returns:
             An array (dimension 1 * N * M) of NDCI values.
         """
-        np.warnings.filterwarnings('ignore')
-        red = ref_red.where(ref_red >= 0)
-        nir = ref_nir.where(ref_nir >= 0)
-
-        return (nir - red) / (nir + red)
+        return apply_kernel(_ndci, ref_red, ref_nir)
@@ -31,13 +31,14 @@ Example:
     out_array2 = algo2(red_array, nir_array, 'rrs')
 """
 
+import math
 from pathlib import Path
 from typing import Optional, Union
 
 import numpy as np
 import xarray as xr
 
-from sisppeo.utils.algos import load_calib, producttype_to_sat
+from sisppeo.utils.algos import apply_kernel, load_calib, producttype_to_sat
 from sisppeo.utils.config import wc_algo_config as algo_config, wc_calib
 from sisppeo.utils.exceptions import InputError
 
@@ -48,10 +49,102 @@ N = Union[int, float]
 
 
 def _nechad(rho, a, c):
-    ssc = a * rho / (1 - (rho / c))
+    # a * rho / (1 - (rho / c)), computed in a single buffer (and with a
+    # scalar reciprocal, so that there is only one division per pixel)
+    ssc = np.multiply(rho, -1 / c)
+    ssc += 1
+    np.divide(rho, ssc, out=ssc)
+    ssc *= a
     return ssc
 
 
+# Kernels below work on reflectances of any type (rho or Rrs). Since
+# _nechad(k * refl, a, c) == _nechad(refl, k * a, c / k), the conversion
+# factor k between both types is folded into the coefficients (and the
+# switching thresholds) by the caller, instead of scaling the whole image.
+# Like the chl-a ones, they reuse their own buffers (through "out=" and
+# in-place operators) to limit the number of full-size arrays allocated.
+def _spm_nechad(refl, a, c, valid_limit):
+    spm = _nechad(refl, a, c)
+    # Invalid pixels are all masked at once, on the output.
+    spm[(refl < 0) | (spm < 0) | (spm >= valid_limit)] = np.nan
+    return spm
+
+
+def _spm_han(red, a_low, c_low, a_high, c_high, switch_inf, switch_sup,
+             inv_log_range, valid_limit):
+    # Each branch is only evaluated where it is needed (i.e. the costly
+    # log10 weights are only computed within the switching zone).
+    low = red <= switch_inf
+    spm = _nechad(red, a_high, c_high)
+    spm[low] = _nechad(red[low], a_low, c_low)
+
+    mixing = ~low & (red < switch_sup)
+    red_mixing = red[mixing]
+    spm_low = _nechad(red_mixing, a_low, c_low)
+    spm_high = spm[mixing]
+    # Weights are log10(switch_sup / red) and log10(red / switch_inf): their
+    # sum is log10(switch_sup / switch_inf), so only one of them is needed
+    # once normalised by "inv_log_range" (i.e. 1 / this sum).
+    w_low = np.divide(switch_sup, red_mixing)
+    np.log10(w_low, out=w_low)
+    w_low *= inv_log_range
+    # w_low * spm_low + (1 - w_low) * spm_high
+    spm_low -= spm_high
+    spm_low *= w_low
+    spm_low += spm_high
+    spm[mixing] = spm_low
+
+    spm[(red < 0) | (spm < 0) | (spm > valid_limit)] = np.nan
+    return spm
+
+
+def _spm_get(red, nir, a_nechad, c_nechad, coef_br, exp_br, switch_inf,
+             switch_sup, valid_limit):
+    spm_low = _nechad(red, a_nechad, c_nechad)
+    # (nir / red) ** exp_br, using the (faster) logarithm and exponential
+    # ufuncs (negative ratios end up as NaN either way).
+    spm_high = np.divide(nir, red)
+    np.log(spm_high, out=spm_high)
+    spm_high *= exp_br
+    np.exp(spm_high, out=spm_high)
+    spm_high *= coef_br
+    # Negative NIR reflectances only invalidate the high/mixing branches.
+    spm_high[nir < 0] = np.nan
+
+    # (1 - w) * spm_low + w * spm_high == spm_low + w * (spm_high - spm_low)
+    w = np.subtract(red, switch_inf)
+    w /= switch_sup - switch_inf
+    spm = np.subtract(spm_high, spm_low)
+    spm *= w
+    spm += spm_low
+
+    np.copyto(spm, spm_low, where=red <= switch_inf)
+    np.copyto(spm, spm_high, where=red >= switch_sup)
+    spm[(red < 0) | (spm < 0) | (spm > valid_limit)] = np.nan
+    return spm
+
+
+def _turbi_dogliotti(red, nir, a_low, c_low, a_high, c_high, switch_inf,
+                     switch_sup, valid_limit):
+    t_low = _nechad(red, a_low, c_low)
+    t_high = _nechad(nir, a_high, c_high)
+    # Negative NIR reflectances only invalidate the high/mixing branches.
+    t_high[nir < 0] = np.nan
+
+    # (1 - w) * t_low + w * t_high == t_low + w * (t_high - t_low)
+    w = np.subtract(red, switch_inf)
+    w /= switch_sup - switch_inf
+    turb = np.subtract(t_high, t_low)
+    turb *= w
+    turb += t_low
+
+    np.copyto(turb, t_low, where=red <= switch_inf)
+    np.copyto(turb, t_high, where=red >= switch_sup)
+    turb[(red < 0) | (turb < 0) | (turb > valid_limit)] = np.nan
+    return turb
+
+
 class SPMNechad:
     """Semi-analytical algorithm to retrieve SPM concentration (in mg/l) from reflectance.
 
@@ -124,14 +217,13 @@ class SPMNechad:
             An array (dimension 1 * N * M) of SPM concentration (in mg/L).
         """
 
-        if data_type == 'rrs':
-            rho = np.pi * rho
+        # rho = pi * Rrs
+        k = np.pi if data_type == 'rrs' else 1
 
-        np.warnings.filterwarnings('ignore')
         # pylint: disable=no-member
         # Loaded in __init__ with "__dict__.update".
-        spm = _nechad(rho, self.a, self.c)
-        spm = spm.where((rho >= 0) & (spm >= 0) & (spm < self._valid_limit))
+        spm = apply_kernel(_spm_nechad, rho, a=k * self.a, c=self.c / k,
+                           valid_limit=self._valid_limit)
         return spm
 
 
@@ -167,9 +259,9 @@ class SPMHan:
                 algorithm (default=_default_calibration_name).
             **_ignored: Unused kwargs sent to trash.
         """
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from invalid_product
@@ -180,11 +272,16 @@ class SPMHan:
         )
         self._valid_limit = calibration_dict['validity_limit']
         try:
-            params = calibration_dict[producttype_to_sat(product_type)]
+            params = calibration_dict[sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with this calibration'
             raise InputError(msg) from invalid_product
         self.__dict__.update(params)
+        # Doesn't depend on data_type (thresholds are scaled the same way).
+        # pylint: disable=no-member
+        # Loaded just above with "__dict__.update".
+        self._inv_log_range = 1 / math.log10(self.switch_sup
+                                             / self.switch_inf)
         self.meta = {'calibration': calibration_name,
                      'validity_limit': self._valid_limit,
                      **params}
@@ -204,26 +301,18 @@ class SPMHan:
         Returns:
             An array (dimension 1 * N * M) of SPM concentration (in mg/L).
         """
-        if data_type == 'rho':
-            refl_red = refl_red / np.pi
-            print(data_type)
+        # Rrs = rho / pi
+        k = 1 / np.pi if data_type == 'rho' else 1
 
-        np.warnings.filterwarnings('ignore')
-        rrs_red = refl_red.where(refl_red >= 0)
         # pylint: disable=no-member
         # Loaded in __init__ whit "__dict__.update".
-        spm_low = _nechad(rrs_red, self.a_low, self.c_low)
-        spm_high = _nechad(rrs_red, self.a_high, self.c_high)
-
-        w_low = np.log10(self.switch_sup) - np.log10(rrs_red)
-        w_high = np.log10(rrs_red) - np.log10(self.switch_inf)
-        spm_mixing = (w_low * spm_low + w_high * spm_high) / (w_low + w_high)
-
-        spm = rrs_red.where(rrs_red > self.switch_inf, spm_low)
-        spm = spm.where(rrs_red < self.switch_sup, spm_high)
-        spm = spm.where((rrs_red <= self.switch_inf)
-                        | (rrs_red >= self.switch_sup), spm_mixing)
-        spm = spm.where((spm >= 0) & (spm <= self._valid_limit))
+        spm = apply_kernel(_spm_han, refl_red,
+                           a_low=k * self.a_low, c_low=self.c_low / k,
+                           a_high=k * self.a_high, c_high=self.c_high / k,
+                           switch_inf=self.switch_inf / k,
+                           switch_sup=self.switch_sup / k,
+                           inv_log_range=self._inv_log_range,
+                           valid_limit=self._valid_limit)
         return spm
 
 
@@ -259,9 +348,9 @@ class SPMGet:
                 algorithm (default=_default_calibration_name).
             **_ignored: Unused kwargs sent to trash.
         """
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from invalid_product
@@ -274,7 +363,7 @@ class SPMGet:
         self._switch_sup = calibration_dict['switch_sup']
         self._valid_limit = calibration_dict['validity_limit']
         try:
-            params = calibration_dict[producttype_to_sat(product_type)]
+            params = calibration_dict[sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with this calibration'
             raise InputError(msg) from invalid_product
@@ -301,28 +390,18 @@ class SPMGet:
         Returns:
             An array (dimension 1 * N * M) of SPM concentration (in mg/L).
         """
-        if data_type == 'rrs':
-            refl_red = np.pi * refl_red
-            refl_nir = np.pi * refl_nir
-
-        np.warnings.filterwarnings('ignore')
-        rho_red = refl_red.where(refl_red >= 0)
-        rho_nir = refl_red.where(refl_nir >= 0)
+        # rho = pi * Rrs (the nir/red band ratio doesn't depend on k)
+        k = np.pi if data_type == 'rrs' else 1
 
         # pylint: disable=no-member
         # Loaded in __init__ whit "__dict__.update".
-        spm_low = _nechad(rho_red, self.a_nechad, self.c_nechad)
-        spm_high = self.coef_br * np.power((rho_nir / rho_red), self.exp_br)
-
-        w = ((rho_red - self._switch_inf)
-             / (self._switch_sup - self._switch_inf))
-        spm_mixing = (1 - w) * spm_low + w * spm_high
-
-        spm = rho_red.where(rho_red > self._switch_inf, spm_low)
-        spm = spm.where(rho_red < self._switch_sup, spm_high)
-        spm = spm.where((rho_red <= self._switch_inf)
-                        | (rho_red >= self._switch_sup), spm_mixing)
-        spm = spm.where((spm >= 0) & (spm <= self._valid_limit))
+        spm = apply_kernel(_spm_get, refl_red, refl_nir,
+                           a_nechad=k * self.a_nechad,
+                           c_nechad=self.c_nechad / k,
+                           coef_br=self.coef_br, exp_br=self.exp_br,
+                           switch_inf=self._switch_inf / k,
+                           switch_sup=self._switch_sup / k,
+                           valid_limit=self._valid_limit)
         return spm
 
 
@@ -358,9 +437,9 @@ class TURBIDogliotti:
                 algorithm (default=_default_calibration_name).
             **_ignored: Unused kwargs sent to trash.
         """
+        sat = producttype_to_sat(product_type)
         try:
-            self.requested_bands = algo_config[self.name][
-                producttype_to_sat(product_type)]
+            self.requested_bands = algo_config[self.name][sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with {self.name}'
             raise InputError(msg) from invalid_product
@@ -373,7 +452,7 @@ class TURBIDogliotti:
         self._switch_sup = calibration_dict['switch_sup']
         self._valid_limit = calibration_dict['validity_limit']
         try:
-            params = calibration_dict[producttype_to_sat(product_type)]
+            params = calibration_dict[sat]
         except KeyError as invalid_product:
             msg = f'{product_type} is not allowed with this calibration'
             raise InputError(msg) from invalid_product
@@ -402,24 +481,15 @@ class TURBIDogliotti:
             An array (dimension 1 * N * M) of Turbidity (in FNU).
         """
 
-        if data_type == 'rrs':
-            rho_red = np.pi * rho_red
-            rho_nir = np.pi * rho_nir
+        # rho = pi * Rrs
+        k = np.pi if data_type == 'rrs' else 1
 
-        np.warnings.filterwarnings('ignore')
-        rho_red = rho_red.where(rho_red >= 0)
-        rho_nir = rho_red.where(rho_nir >= 0)
         # pylint: disable=no-member
         # Loaded in __init__ whit "__dict__.update".
-        t_low = _nechad(rho_red, self.a_low, self.c_low)
-        t_high = _nechad(rho_nir, self.a_high, self.c_high)
-        w = ((rho_red - self._switch_inf)
-             / (self._switch_sup - self._switch_inf))
-        t_mixing = (1 - w) * t_low + w * t_high
-
-        turb = rho_red.where(rho_red > self._switch_inf, t_low)
-        turb = turb.where(rho_red < self._switch_sup, t_high)
-        turb = turb.where((rho_red <= self._switch_inf)
-                          | (rho_red >= self._switch_sup), t_mixing)
-        turb = turb.where((turb >= 0) & (turb <= self._valid_limit))
+        turb = apply_kernel(_turbi_dogliotti, rho_red, rho_nir,
+                            a_low=k * self.a_low, c_low=self.c_low / k,
+                            a_high=k * self.a_high, c_high=self.c_high / k,
+                            switch_inf=self._switch_inf / k,
+                            switch_sup=self._switch_sup / k,
+                            valid_limit=self._valid_limit)
         return turb
@@ -0,0 +1,55 @@
+# Copyright 2020 Arthur Coqué, Pôle OFB-INRAE ECLA, UR RECOVER
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the kernel-based wc algorithms."""
+
+import numpy as np
+import xarray as xr
+
+from sisppeo.wcproducts.chla import CHLAGons
+from sisppeo.wcproducts.spm import SPMGet, TURBIDogliotti
+
+
+def _band(seed, shape, dims):
+    rng = np.random.default_rng(seed)
+    return xr.DataArray(rng.uniform(0, 0.1, shape).astype(np.float32),
+                        dims=dims)
+
+
+def test_lower_dimension_band_is_broadcast():
+    """A band without the time axis is broadcast like with xarray."""
+    red = _band(0, (3, 20, 30), ('time', 'y', 'x'))
+    rededge = _band(1, (3, 20, 30), ('time', 'y', 'x'))
+    nir = _band(2, (20, 30), ('y', 'x'))
+    algo = CHLAGons('S2_GRS')
+
+    out = algo(red, rededge, nir, data_type='rho')
+    expected = algo(*xr.broadcast(red, rededge, nir), data_type='rho')
+
+    assert out.shape == (3, 20, 30)
+    np.testing.assert_array_equal(out.transpose(*expected.dims), expected)
+
+
+def test_lower_dimension_nir_in_switching_spm_kernels():
+    """Negative NIR pixels are masked even if NIR lacks the time axis."""
+    red = _band(0, (3, 20, 30), ('time', 'y', 'x'))
+    nir = _band(1, (20, 30), ('y', 'x'))
+    nir[0, :10] = -0.01
+    for algo in (SPMGet('S2_GRS'), TURBIDogliotti('S2_GRS')):
+        out = algo(red, nir, data_type='rho')
+        expected = algo(*xr.broadcast(red, nir), data_type='rho')
+
+        assert out.shape == (3, 20, 30)
+        np.testing.assert_array_equal(out.transpose(*expected.dims),
+                                      expected)